@@ -377,6 +377,11 @@ class VFK_UI(qg.QDialog):
             if j == 0:
                 off_vfk = pmc.group(em=True, n=  name + 'OFF_vfk')
                 pmc.xform(off_vfk, ws=True, m=jmtx)
+                ### Rig metadata, used by vfk_profile to find the rig's nodes
+                for attr, value in (('vfkName', name), ('vfkJointGroupPrefix', jointGroupPrefix),
+                                    ('vfkControlPrefix', controlPrefix)):
+                    pmc.addAttr(off_vfk, ln=attr, dt='string')
+                    pmc.setAttr(off_vfk + '.' + attr, value, type='string')
                 root = pmc.listRelatives(joints[0], parent=True)      
                 for c in xrange(int(numControls)):
                     jparent = pmc.listRelatives(joints[j], parent=True)
@@ -0,0 +1,551 @@
+'''
+Offline evaluator for the VFK weight network.
+
+Models the handful of Maya utility nodes the rig is built from (multiplyDivide,
+plusMinusAverage, condition, setRange) plus plain transforms, so a network can
+be pulled through control poses without Maya. Evaluation is pull based: setting
+a plug dirties everything downstream of it, getting a plug recomputes only the
+dirty nodes it depends on and caches the result until the next change.
+
+Per-node compute counts are kept in Graph.eval_counts as a rough proxy for
+DG cost.
+
+    graph = Graph()
+    controls, vfk_grps = build_vfk_network(graph, name='tent_', numJoints=20, numControls=3)
+    result = sweep(graph, controls, vfk_grps, count=100)
+    print result['seconds'], result['evaluations']
+'''
+import math
+import random
+import time
+
+
+# Compound attributes and their scalar children
+_XYZ = ('X', 'Y', 'Z')
+_RGB = ('R', 'G', 'B')
+
+COMPOUNDS = {
+    'multiplyDivide': {'input1': _XYZ, 'input2': _XYZ, 'output': _XYZ},
+    'plusMinusAverage': {},
+    'condition': {'colorIfTrue': _RGB, 'colorIfFalse': _RGB, 'outColor': _RGB},
+    'setRange': {'value': _XYZ, 'min': _XYZ, 'max': _XYZ,
+                 'oldMin': _XYZ, 'oldMax': _XYZ, 'outValue': _XYZ},
+    'transform': {'translate': _XYZ, 'rotate': _XYZ, 'scale': _XYZ},
+}
+
+# Output attributes, computed by the node
+OUTPUTS = {
+    'multiplyDivide': ('outputX', 'outputY', 'outputZ'),
+    'plusMinusAverage': ('output1D',),
+    'condition': ('outColorR', 'outColorG', 'outColorB'),
+    'setRange': ('outValueX', 'outValueY', 'outValueZ'),
+    'transform': (),
+}
+
+# Input attributes read from the scene, plusMinusAverage.input1D is a multi
+# and is read by its indices
+INPUTS = {
+    'multiplyDivide': ('operation', 'input1', 'input2'),
+    'plusMinusAverage': ('operation',),
+    'condition': ('operation', 'firstTerm', 'secondTerm', 'colorIfTrue', 'colorIfFalse'),
+    'setRange': ('value', 'min', 'max', 'oldMin', 'oldMax'),
+}
+
+# Non-zero defaults, everything else defaults to 0.0
+DEFAULTS = {
+    'multiplyDivide': {'operation': 1, 'input2X': 1.0, 'input2Y': 1.0, 'input2Z': 1.0},
+    'plusMinusAverage': {'operation': 1},
+    'condition': {'colorIfFalseR': 1.0, 'colorIfFalseG': 1.0, 'colorIfFalseB': 1.0},
+    'setRange': {},
+    'transform': {'scaleX': 1.0, 'scaleY': 1.0, 'scaleZ': 1.0},
+}
+
+# Short transform attribute names, as used by the rig ('.tx' etc.)
+SHORT_NAMES = {
+    'tx': 'translateX', 'ty': 'translateY', 'tz': 'translateZ',
+    'rx': 'rotateX', 'ry': 'rotateY', 'rz': 'rotateZ',
+    'sx': 'scaleX', 'sy': 'scaleY', 'sz': 'scaleZ',
+    't': 'translate', 'r': 'rotate', 's': 'scale',
+}
+
+NODE_TYPES = ('multiplyDivide', 'plusMinusAverage', 'condition', 'setRange')
+
+
+def _split(plug):
+    node, attr = plug.split('.', 1)
+    return node, SHORT_NAMES.get(attr, attr)
+
+
+def _compute_multiplyDivide(get):
+    op = int(get('operation'))
+    out = {}
+    for axis in _XYZ:
+        a = get('input1' + axis)
+        b = get('input2' + axis)
+        if op == 1:
+            value = a * b
+        elif op == 2:
+            # Maya warns on divide by zero, pass input1 through rather than raising
+            value = a / b if b != 0 else a
+        elif op == 3:
+            # no real result for a negative base with a fractional exponent, or 0 to a negative power
+            if (a < 0 and b != int(b)) or (a == 0 and b < 0):
+                value = 0.0
+            else:
+                value = a ** b
+        else:
+            value = a
+        out['output' + axis] = value
+    return out
+
+
+def _compute_plusMinusAverage(get, indices):
+    op = int(get('operation'))
+    values = [get('input1D[%d]' % i) for i in indices]
+    if not values:
+        value = 0.0
+    elif op == 1:
+        value = sum(values)
+    elif op == 2:
+        value = values[0] - sum(values[1:])
+    elif op == 3:
+        value = sum(values) / len(values)
+    else:
+        value = values[0]
+    return {'output1D': value}
+
+
+_COMPARE = {
+    0: lambda a, b: a == b,
+    1: lambda a, b: a != b,
+    2: lambda a, b: a > b,
+    3: lambda a, b: a >= b,
+    4: lambda a, b: a < b,
+    5: lambda a, b: a <= b,
+}
+
+
+def _compute_condition(get):
+    source = 'colorIfTrue' if _COMPARE[int(get('operation'))](get('firstTerm'), get('secondTerm')) \
+        else 'colorIfFalse'
+    return dict(('outColor' + c, get(source + c)) for c in _RGB)
+
+
+def _compute_setRange(get):
+    out = {}
+    for axis in _XYZ:
+        lo, hi = get('min' + axis), get('max' + axis)
+        old_lo, old_hi = get('oldMin' + axis), get('oldMax' + axis)
+        if old_hi == old_lo:
+            value = lo
+        else:
+            t = (get('value' + axis) - old_lo) / (old_hi - old_lo)
+            value = lo + min(max(t, 0.0), 1.0) * (hi - lo)
+        out['outValue' + axis] = value
+    return out
+
+
+class Graph(object):
+    '''
+    Minimal dependency graph with cmds-like createNode/setAttr/connectAttr/getAttr.
+    Compound plugs ('.rotate', '.outColor', ...) are expanded to their scalar
+    children, so connections and values are always stored per scalar plug.
+    '''
+
+    def __init__(self):
+        self.nodes = {}
+        self.values = {}
+        self.sources = {}
+        self.destinations = {}
+        self.dirty = set()
+        self.indices = {}
+        self.eval_counts = {}
+        self._order = None
+
+    def createNode(self, node_type, n):
+        if node_type not in COMPOUNDS:
+            raise ValueError('Unsupported node type: %s' % node_type)
+        if n in self.nodes:
+            raise ValueError('Node already exists: %s' % n)
+        self.nodes[n] = node_type
+        self.eval_counts[n] = 0
+        self.dirty.add(n)
+        self._order = None
+        return n
+
+    def nodeType(self, node):
+        return self.nodes[node]
+
+    def _expand(self, plug):
+        node, attr = _split(plug)
+        children = COMPOUNDS[self.nodes[node]].get(attr)
+        if children:
+            return ['%s.%s%s' % (node, attr, c) for c in children]
+        return ['%s.%s' % (node, attr)]
+
+    def _is_output(self, plug):
+        node, attr = plug.split('.', 1)
+        return attr in OUTPUTS[self.nodes[node]]
+
+    def _add_index(self, plug):
+        '''Track the used indices of plusMinusAverage.input1D.'''
+        node, attr = plug.split('.', 1)
+        if attr.startswith('input1D['):
+            self.indices.setdefault(node, set()).add(int(attr[8:-1]))
+
+    def _default(self, plug):
+        node, attr = plug.split('.', 1)
+        return float(DEFAULTS[self.nodes[node]].get(attr, 0.0))
+
+    def setAttr(self, plug, value):
+        plugs = self._expand(plug)
+        if not isinstance(value, (list, tuple)):
+            value = [value] * len(plugs)
+        for p, v in zip(plugs, value):
+            if p in self.sources:
+                raise RuntimeError('Cannot set connected plug: %s' % p)
+            if self._is_output(p):
+                raise RuntimeError('Cannot set output plug: %s' % p)
+            self.values[p] = float(v)
+            self._add_index(p)
+            self._propagate(p)
+
+    def connectAttr(self, src, dst, f=False):
+        src_plugs = self._expand(src)
+        dst_plugs = self._expand(dst)
+        if len(src_plugs) != len(dst_plugs):
+            raise ValueError('Cannot connect %s to %s' % (src, dst))
+        for s, d in zip(src_plugs, dst_plugs):
+            if d in self.sources:
+                if not f:
+                    raise RuntimeError('%s is already connected' % d)
+                self.disconnectAttr(self.sources[d], d)
+            self.sources[d] = s
+            self.destinations.setdefault(s, set()).add(d)
+            self._add_index(d)
+            self._propagate(d)
+        self._order = None
+
+    def disconnectAttr(self, src, dst):
+        for s, d in zip(self._expand(src), self._expand(dst)):
+            if self.sources.get(d) == s:
+                del self.sources[d]
+                self.destinations[s].discard(d)
+                self.values.pop(d, None)
+                self._propagate(d)
+        self._order = None
+
+    def _propagate(self, plug):
+        '''Mark a changed plug's downstream nodes and plugs dirty.'''
+        stack = [plug]
+        while stack:
+            plug = stack.pop()
+            node = plug.split('.', 1)[0]
+            if plug in self.sources:
+                self.values.pop(plug, None)
+            if self._is_output(plug) or self.nodes[node] == 'transform':
+                stack.extend(self.destinations.get(plug, ()))
+                continue
+            # an input changed, every output of the node is affected
+            if node in self.dirty:
+                continue
+            self.dirty.add(node)
+            for out in OUTPUTS[self.nodes[node]]:
+                out_plug = '%s.%s' % (node, out)
+                self.values.pop(out_plug, None)
+                stack.append(out_plug)
+
+    def getAttr(self, plug):
+        plugs = self._expand(plug)
+        values = [self._pull(p) for p in plugs]
+        return values if len(plugs) > 1 else values[0]
+
+    def _pull(self, plug):
+        if plug in self.values:
+            return self.values[plug]
+        if plug in self.sources:
+            value = self._pull(self.sources[plug])
+            self.values[plug] = value
+            return value
+        if self._is_output(plug):
+            self._compute(plug.split('.', 1)[0])
+            return self.values[plug]
+        return self._default(plug)
+
+    def _compute(self, node):
+        node_type = self.nodes[node]
+        get = lambda attr: self._pull('%s.%s' % (node, attr))
+        if node_type == 'plusMinusAverage':
+            out = _compute_plusMinusAverage(get, sorted(self.indices.get(node, ())))
+        else:
+            out = globals()['_compute_' + node_type](get)
+        for attr, value in out.items():
+            self.values['%s.%s' % (node, attr)] = value
+        self.dirty.discard(node)
+        self.eval_counts[node] += 1
+
+    def topological_order(self):
+        '''Compute nodes ordered so every node follows the nodes it depends on.'''
+        if self._order is None:
+            upstream = dict((node, set()) for node in self.nodes)
+            for dst, src in self.sources.items():
+                upstream[dst.split('.', 1)[0]].add(src.split('.', 1)[0])
+            order, visited = [], set()
+            for root in sorted(self.nodes):
+                stack = [(root, False)]
+                while stack:
+                    node, done = stack.pop()
+                    if done:
+                        order.append(node)
+                        continue
+                    if node in visited:
+                        continue
+                    visited.add(node)
+                    stack.append((node, True))
+                    stack.extend((n, False) for n in upstream[node] if n not in visited)
+            self._order = [n for n in order if self.nodes[n] != 'transform']
+        return self._order
+
+    def evaluate(self):
+        '''Compute every dirty node in topological order.'''
+        for node in self.topological_order():
+            if node in self.dirty:
+                self._compute(node)
+
+    def reset_counts(self):
+        for node in self.eval_counts:
+            self.eval_counts[node] = 0
+
+
+def build_vfk_network(graph, name='', numJoints=20.0, numControls=3.0, jointPrefix='joint_',
+                      jointGroupPrefix='vfk_grp_', controlPrefix='CTRL_vfk_'):
+    '''
+    Build the weight network of VFK_UI.create_vfk into graph, with the same node
+    names and connections. Follicles, surface and skinCluster are left out;
+    controls start at the positions create_vfk spaces them at.
+    Returns (controls, vfk_grps), vfk_grps as [joint][control].
+    '''
+    numJoints = float(numJoints)
+    joints = []
+    for j in range(int(numJoints)):
+        joint = graph.createNode('transform', n=jointPrefix + str(j+1))
+        graph.setAttr(joint + '.position', j/(numJoints-1))
+        joints.append(joint)
+
+    vfk_grps = [[graph.createNode('transform', n=name + jointGroupPrefix + 'j' + str(j+1) + '_c' + str(i+1))
+                 for i in range(int(numControls))] for j in range(len(joints))]
+
+    controls = []
+    for i in range(int(numControls)):
+        ctrl = graph.createNode('transform', n=name + controlPrefix + str(i+1))
+        graph.setAttr(ctrl + '.position', 10.0 * (i+1) / (numControls+1))
+        graph.setAttr(ctrl + '.falloff', 0.5)
+        controls.append(ctrl)
+
+        multD = graph.createNode('multiplyDivide', n=name + 'multD_jAff_vfk_' + str(i+1))
+        setR = graph.createNode('setRange', n=name + 'setR_jAff_vfk_' + str(i+1))
+        graph.connectAttr(ctrl + '.falloff', multD + '.input1X')
+        graph.setAttr(multD + '.input2X', 2)
+        graph.setAttr(multD + '.operation', 1)
+        graph.connectAttr(multD + '.outputX', setR + '.valueX')
+        graph.setAttr(setR + '.oldMinX', 0)
+        graph.setAttr(setR + '.oldMaxX', 1)
+        graph.setAttr(setR + '.minX', 0)
+        graph.setAttr(setR + '.maxX', numJoints)
+        graph.connectAttr(setR + '.outValueX', ctrl + '.numberOfJointsAffected')
+
+        div_ten = graph.createNode('multiplyDivide', n='DIV_' + name + controlPrefix + str(i+1))
+        graph.setAttr(div_ten + '.input2X', 10)
+        graph.setAttr(div_ten + '.operation', 2)
+        graph.connectAttr(ctrl + '.position', div_ten + '.input1X')
+
+        fPos_plus = graph.createNode('plusMinusAverage', n=name + 'fPosPlus_vfk_' + str(i+1))
+        graph.connectAttr(div_ten + '.outputX', fPos_plus + '.input1D[0]', f=True)
+        graph.connectAttr(ctrl + '.falloff', fPos_plus + '.input1D[1]', f=True)
+        graph.setAttr(fPos_plus + '.operation', 1)
+
+        fPos_minus = graph.createNode('plusMinusAverage', n=name + 'fPosMinus_vfk_' + str(i+1))
+        graph.connectAttr(div_ten + '.outputX', fPos_minus + '.input1D[0]', f=True)
+        graph.connectAttr(ctrl + '.falloff', fPos_minus + '.input1D[1]', f=True)
+        graph.setAttr(fPos_minus + '.operation', 2)
+
+        for f in (fPos_plus, fPos_minus):
+            for j in range(len(joints)):
+                upperM = graph.createNode('plusMinusAverage', n=name + f + '_upperM_j' + str(j+1) + '_c' + str(i+1))
+                lowerM = graph.createNode('plusMinusAverage', n=name + f + '_lowerM_j' + str(j+1) + '_c' + str(i+1))
+                graph.setAttr(upperM + '.operation', 2)
+                graph.setAttr(lowerM + '.operation', 2)
+                graph.connectAttr(joints[j] + '.position', upperM + '.input1D[0]')
+                graph.connectAttr(f + '.output1D', upperM + '.input1D[1]')
+                graph.connectAttr(div_ten + '.outputX', lowerM + '.input1D[0]')
+                graph.connectAttr(f + '.output1D', lowerM + '.input1D[1]')
+
+                divA = graph.createNode('multiplyDivide', n=f + '_divA_j' + str(j+1) + '_c' + str(i+1))
+                graph.setAttr(divA + '.operation', 2)
+                graph.connectAttr(upperM + '.output1D', divA + '.input1X')
+                graph.connectAttr(lowerM + '.output1D', divA + '.input2X')
+
+                multA = graph.createNode('multiplyDivide', n=f + '_multA_j' + str(j+1) + '_c' + str(i+1))
+                graph.setAttr(multA + '.operation', 1)
+                graph.connectAttr(divA + '.outputX', multA + '.input1X')
+                graph.setAttr(multA + '.input2X', 2)
+
+                divB = graph.createNode('multiplyDivide', n=f + '_divB_j' + str(j+1) + '_c' + str(i+1))
+                graph.setAttr(divB + '.operation', 2)
+                graph.connectAttr(multA + '.outputX', divB + '.input1X')
+                graph.connectAttr(ctrl + '.numberOfJointsAffected', divB + '.input2X')
+
+        for j in range(len(joints)):
+            cond = graph.createNode('condition', n=name + 'cond_j' + str(j+1) + '_c' + str(i+1))
+            graph.setAttr(cond + '.operation', 3)
+            graph.connectAttr(div_ten + '.outputX', cond + '.firstTerm')
+            graph.connectAttr(joints[j] + '.position', cond + '.secondTerm')
+            for c in 'RGB':
+                graph.connectAttr(fPos_minus + '_divB_j' + str(j+1) + '_c' + str(i+1) + '.outputX', cond + '.colorIfTrue' + c)
+                graph.connectAttr(fPos_plus + '_divB_j' + str(j+1) + '_c' + str(i+1) + '.outputX', cond + '.colorIfFalse' + c)
+
+            cond_neg = graph.createNode('condition', n=name + 'cond_neg_j' + str(j+1) + '_c' + str(i+1))
+            graph.connectAttr(cond + '.outColorR', cond_neg + '.firstTerm')
+            graph.setAttr(cond_neg + '.secondTerm', 0)
+            graph.setAttr(cond_neg + '.operation', 2)
+            graph.connectAttr(cond + '.outColor', cond_neg + '.colorIfTrue')
+            graph.setAttr(cond_neg + '.colorIfFalse', [0, 0, 0])
+
+            multiFinalRot = graph.createNode('multiplyDivide', n=name + 'multiFinalRot_j' + str(j+1) + '_c' + str(i+1))
+            graph.setAttr(multiFinalRot + '.operation', 1)
+            graph.connectAttr(cond_neg + '.outColor', multiFinalRot + '.input1')
+            graph.connectAttr(ctrl + '.rotate', multiFinalRot + '.input2')
+            graph.connectAttr(multiFinalRot + '.output', vfk_grps[j][i] + '.rotate')
+
+    return controls, vfk_grps
+
+
+def rotation_matrix(rotate):
+    '''3x3 matrix of an xyz rotate order euler rotation, in degrees.'''
+    x, y, z = [math.radians(a) for a in rotate]
+    cx, sx, cy, sy, cz, sz = math.cos(x), math.sin(x), math.cos(y), math.sin(y), math.cos(z), math.sin(z)
+    # row vectors, R = Rx * Ry * Rz as Maya composes xyz
+    return [[cy*cz, cy*sz, -sy],
+            [sx*sy*cz - cx*sz, sx*sy*sz + cx*cz, sx*cy],
+            [cx*sy*cz + sx*sz, cx*sy*sz - sx*cz, cx*cy]]
+
+
+def _mult(a, b):
+    return [[sum(a[r][k] * b[k][c] for k in range(3)) for c in range(3)] for r in range(3)]
+
+
+def joint_rotations(graph, vfk_grps):
+    '''
+    Local rotation each joint receives from its stack of vfk groups, as a 3x3
+    matrix per joint. Comparing these rather than raw group rotates lets a
+    variant with a different group layout be checked against the original.
+    '''
+    result = []
+    for stack in vfk_grps:
+        # groups are nested c1 > c2 > ..., so the last group is closest to the joint
+        mtx = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+        for grp in stack:
+            mtx = _mult(rotation_matrix(graph.getAttr(grp + '.rotate')), mtx)
+        result.append(mtx)
+    return result
+
+
+def random_poses(controls, count, seed=0, maxRotate=90.0):
+    '''Yield count dicts of {plug: value} randomly posing the controls.'''
+    rand = random.Random(seed)
+    for _ in range(count):
+        pose = {}
+        for ctrl in controls:
+            pose[ctrl + '.rotate'] = [rand.uniform(-maxRotate, maxRotate) for _ in range(3)]
+            pose[ctrl + '.position'] = rand.uniform(0, 10)
+            pose[ctrl + '.falloff'] = rand.uniform(0.1, 1)
+        yield pose
+
+
+def sweep(graph, controls, vfk_grps, count=100, seed=0):
+    '''
+    Pull graph through count random control poses.
+    Returns a dict with the joint rotations per pose, total seconds spent and
+    the per-node evaluation counts accumulated over the sweep.
+    '''
+    graph.reset_counts()
+    rotations = []
+    start = time.time()
+    for pose in random_poses(controls, count, seed):
+        for plug, value in sorted(pose.items()):
+            graph.setAttr(plug, value)
+        rotations.append(joint_rotations(graph, vfk_grps))
+    seconds = time.time() - start
+    counts = dict((node, n) for node, n in graph.eval_counts.items() if n)
+    return {'rotations': rotations,
+            'seconds': seconds,
+            'evaluations': sum(counts.values()),
+            'eval_counts': counts}
+
+
+def max_difference(rotations_a, rotations_b):
+    '''Largest absolute difference between two sweeps' joint rotation matrices.'''
+    return max([abs(a - b)
+                for pose_a, pose_b in zip(rotations_a, rotations_b)
+                for mtx_a, mtx_b in zip(pose_a, pose_b)
+                for row_a, row_b in zip(mtx_a, mtx_b)
+                for a, b in zip(row_a, row_b)] or [0.0])
+
+
+def graph_from_scene(roots):
+    '''
+    Capture the utility node network driving the rotates of the given nodes in
+    the open Maya scene, e.g. graph_from_scene(mc.ls('tent_vfk_grp_*')).
+    Walks upstream through the supported node types; any other node becomes a
+    transform holding the current values of the plugs the network reads, so
+    keyed controls are captured at their current pose.
+    '''
+    import maya.cmds as mc
+
+    def scene_value(plug):
+        value = mc.getAttr(plug)
+        return list(value[0]) if isinstance(value, list) else value
+
+    graph = Graph()
+    connections = []
+    queue = [root + '.rotate' for root in roots]
+    seen = set()
+    while queue:
+        plug = queue.pop()
+        if plug in seen:
+            continue
+        seen.add(plug)
+        node = plug.split('.', 1)[0]
+
+        if node not in graph.nodes:
+            node_type = mc.nodeType(node)
+            if node_type in NODE_TYPES:
+                graph.createNode(node_type, n=node)
+                attrs = list(INPUTS[node_type])
+                if node_type == 'plusMinusAverage':
+                    attrs += ['input1D[%d]' % i for i in mc.getAttr(node + '.input1D', multiIndices=True) or []]
+                for attr in attrs:
+                    graph.setAttr(node + '.' + attr, scene_value(node + '.' + attr))
+                pairs = mc.listConnections(node, source=True, destination=False, plugs=True,
+                                           connections=True, skipConversionNodes=True) or []
+                connections.extend(zip(pairs[1::2], pairs[::2]))
+                queue.extend(pairs[1::2])
+            else:
+                graph.createNode('transform', n=node)
+
+        if graph.nodes[node] == 'transform':
+            if node not in roots:
+                graph.setAttr(plug, scene_value(plug))
+            # only follow utility nodes, anything else (animCurves, constraints, ...)
+            # leaves the plug as a value that sweep() can set
+            sources = [src for src in mc.listConnections(plug, source=True, destination=False, plugs=True,
+                                                         skipConversionNodes=True) or []
+                       if mc.nodeType(src.split('.', 1)[0]) in NODE_TYPES]
+            connections.extend((src, plug) for src in sources)
+            queue.extend(sources)
+
+    for src, dst in connections:
+        graph.connectAttr(src, dst, f=True)
+    graph.evaluate()
+    graph.reset_counts()
+    return graph
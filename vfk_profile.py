@@ -0,0 +1,270 @@
+'''
+Playback profiler for built VFK rigs.
+
+Plays a frame range with the rig's controls moving, once uninstrumented in the
+scene's own evaluation mode to measure frames per second, then again in DG mode
+to time every node of the rig with dgtimer, grouped by category. dgtimer sees
+nothing under the Evaluation Manager, hence the second pass in DG mode. Reports
+the hottest nodes and optionally writes the report as JSON so rig cost can be
+tracked across assets. The timed pass is also recorded with Maya's profiler,
+and saved next to the JSON for inspection in the Profiler window.
+
+    import vfk_profile
+    vfk_profile.profile_vfk('tentacle_', start=1, end=120, output='/tmp/tentacle_vfk.json')
+'''
+import json
+import math
+import os
+import tempfile
+import time
+
+import maya.cmds as mc
+
+import vfk_graph
+
+CATEGORIES = ('weight network', 'vfk_grp transforms', 'follicles', 'ctrlDBL offsets', 'skinCluster', 'other')
+
+# Node types of the weight network, including the unit conversions Maya inserts
+# around the rotate connections
+WEIGHT_TYPES = vfk_graph.NODE_TYPES + ('unitConversion',)
+
+
+def find_rigs():
+    '''
+    Return {OFF_vfk group: metadata} for every VFK rig in the scene, including
+    referenced ones, read from the attributes create_vfk adds to the group.
+    'prefix' is the rig's name prefix including the group's namespace.
+    '''
+    rigs = {}
+    for node in mc.ls('*.vfkName', objectsOnly=True, recursive=True) or []:
+        namespace = node.rpartition(':')[0]
+        rigs[node] = {
+            'prefix': (namespace + ':' if namespace else '') + mc.getAttr(node + '.vfkName'),
+            'jointGroupPrefix': mc.getAttr(node + '.vfkJointGroupPrefix'),
+            'controlPrefix': mc.getAttr(node + '.vfkControlPrefix'),
+        }
+    return rigs
+
+
+def _upstream(nodes, types):
+    '''Nodes of the given types feeding nodes, directly or through each other.'''
+    found = []
+    queue = list(nodes)
+    seen = set(queue)
+    while queue:
+        node = queue.pop()
+        for src in mc.listConnections(node, source=True, destination=False, skipConversionNodes=False) or []:
+            if src not in seen and mc.nodeType(src) in types:
+                seen.add(src)
+                found.append(src)
+                queue.append(src)
+    return found
+
+
+def rig_nodes(name, jointGroupPrefix='vfk_grp_', controlPrefix='CTRL_vfk_'):
+    '''
+    Return ({category: [nodes]}, controls) for the rig with the given name
+    prefix, which may include a namespace ('char:tent_'). Defaults match
+    create_vfk, for rigs built before metadata was added.
+    '''
+    namespace = name.rpartition(':')[0]
+    namespace = namespace + ':' if namespace else ''
+    controls = sorted(mc.ls(name + controlPrefix + '*', type='transform') or [])
+    vfk_grps = sorted(mc.ls(name + jointGroupPrefix + 'j*_c*', type='transform') or [])
+    surface = name + 'vfk_surface'
+
+    # controls too, their numberOfJointsAffected is driven by the network
+    weights = _upstream(vfk_grps + controls, WEIGHT_TYPES)
+
+    follicles = []
+    if mc.objExists(surface):
+        follicles = mc.listConnections(surface + '.local', type='follicle', shapes=True) or []
+        if follicles:
+            follicles += mc.listRelatives(follicles, parent=True) or []
+
+    dbl = []
+    for ctrl in controls:
+        dbl += [namespace + n + ctrl[len(namespace):] for n in ('locDBL_parent_', 'locDBL_offset_',
+                                   'mdTRNS_locDBL_', 'mdROT_locDBL_', 'mdSCL_locDBL_')]
+
+    dbl = [n for n in dbl if mc.objExists(n)]
+    for md in mc.ls(dbl, type='multiplyDivide') or []:
+        dbl += mc.listConnections(md, skipConversionNodes=False, type='unitConversion') or []
+
+    skin = mc.ls(mc.listHistory(surface) or [], type='skinCluster') if mc.objExists(surface) else []
+    joints = []
+    for sc in skin:
+        joints += mc.skinCluster(sc, q=True, influence=True) or []
+
+    categories = {
+        'weight network': weights,
+        'vfk_grp transforms': vfk_grps,
+        'follicles': follicles,
+        'ctrlDBL offsets': dbl,
+        'skinCluster': skin,
+        'other': controls + joints + [n for n in (surface,) if mc.objExists(n)],
+    }
+    return categories, controls
+
+
+def _node_times(nodes):
+    '''
+    {node: seconds} of compute time dgtimer recorded for nodes. The listing is
+    written to a file rather than the Script Editor and parsed in one go, using
+    its header to find the Self and Name columns.
+    '''
+    path = os.path.join(tempfile.gettempdir(), 'vfk_dgtimer.txt')
+    mc.dgtimer(nodes, query=True, outputFile=path, timerType='compute', sortType='none',
+               maxDisplay=len(nodes), threshold=0, uniqueName=True, returnType='none')
+    with open(path) as f:
+        lines = [line.lstrip('/').split() for line in f]
+    os.remove(path)
+
+    names = set(nodes)
+    times = {}
+    self_col = name_col = None
+    scale = 1.0
+    for tokens in lines:
+        if 'Name' in tokens and any(t.startswith('Self') for t in tokens):
+            self_col = [i for i, t in enumerate(tokens) if t.startswith('Self')][0]
+            name_col = tokens.index('Name') - len(tokens)
+            scale = 0.001 if '(ms)' in ' '.join(tokens) else 1.0
+        elif self_col is not None and len(tokens) > self_col and tokens[name_col] in names:
+            try:
+                times[tokens[name_col]] = float(tokens[self_col]) * scale
+            except ValueError:
+                pass
+    if self_col is None:
+        # unrecognised listing, fall back to querying the nodes one at a time
+        for node in nodes:
+            times[node] = float(mc.dgtimer(node, query=True, outputFile=path, timerType='compute',
+                                           returnType='all') or 0.0)
+        os.remove(path)
+    return dict((node, times.get(node, 0.0)) for node in nodes)
+
+
+def _pose(controls, rest, frame, maxRotate):
+    '''Swing each control and slide it along the surface, out of phase with the others.'''
+    for i, ctrl in enumerate(controls):
+        phase = frame * 0.1 + i
+        mc.setAttr(ctrl + '.rotate', maxRotate * math.sin(phase), maxRotate * math.sin(phase * 0.7),
+                   maxRotate * math.cos(phase))
+        mc.setAttr(ctrl + '.position', min(max(rest[ctrl] + 2 * math.sin(phase * 0.5), 0), 10))
+
+
+def _play(frames, controls, rest, surface, animate, maxRotate):
+    '''Play frames, posing the controls if animate. Returns the seconds taken.'''
+    batch = mc.about(batch=True)
+    begin = time.time()
+    for frame in frames:
+        mc.currentTime(frame, update=not animate)
+        if animate:
+            _pose(controls, rest, frame, maxRotate)
+        if batch:
+            # no viewport to pull the graph, query the deformed surface instead
+            mc.xform(surface + '.cv[0][0]', q=True, ws=True, t=True)
+        else:
+            mc.refresh(force=True)
+    return time.time() - begin
+
+
+def profile_vfk(name=None, start=None, end=None, output=None, top=10, animate=True, maxRotate=45.0):
+    '''
+    Profile playback of a VFK rig.
+    name: OFF_vfk group or name prefix of the rig, including its namespace.
+          May be left out when the scene holds a single rig.
+    start, end: frame range, defaults to the playback range.
+    output: path of a JSON report. The profiler recording goes next to it.
+    animate: drive the controls with a procedural pose each frame. Turn off to
+             profile the rig's existing animation instead.
+    Returns the report dict.
+    '''
+    rigs = find_rigs()
+    if name is None:
+        if len(rigs) != 1:
+            print('Error: specify a rig, found rigs: %s' % ', '.join(sorted(rigs)))
+            return
+        name = list(rigs)[0]
+    root = name if name in rigs else None
+    for node, metadata in rigs.items():
+        if metadata['prefix'] == name:
+            root = node
+    metadata = rigs.get(root, {})
+    name = metadata.get('prefix', name)
+    categories, controls = rig_nodes(name, metadata.get('jointGroupPrefix', 'vfk_grp_'),
+                                     metadata.get('controlPrefix', 'CTRL_vfk_'))
+    if not controls:
+        print('Error: no VFK controls found for %s' % name)
+        return
+
+    if start is None:
+        start = mc.playbackOptions(q=True, minTime=True)
+    if end is None:
+        end = mc.playbackOptions(q=True, maxTime=True)
+    frames = list(range(int(start), int(end) + 1))
+    if not frames:
+        print('Error: start frame %s is after end frame %s' % (start, end))
+        return
+
+    surface = name + 'vfk_surface'
+    mode = mc.evaluationManager(q=True, mode=True)[0]
+    rest_time = mc.currentTime(q=True)
+    rest = dict((ctrl, mc.getAttr(ctrl + '.position')) for ctrl in controls)
+    rest_rotate = dict((ctrl, mc.getAttr(ctrl + '.rotate')[0]) for ctrl in controls)
+
+    try:
+        # uninstrumented pass in the scene's own evaluation mode, for fps
+        seconds = _play(frames, controls, rest, surface, animate, maxRotate)
+
+        # instrumented pass in DG mode, for the per-node breakdown
+        mc.evaluationManager(mode='off')
+        mc.profiler(sampling=False)
+        mc.profiler(reset=True)
+        mc.dgtimer(on=True, reset=True)
+        mc.profiler(sampling=True)
+        _play(frames, controls, rest, surface, animate, maxRotate)
+    finally:
+        mc.profiler(sampling=False)
+        mc.dgtimer(off=True)
+        mc.evaluationManager(mode=mode)
+        if animate:
+            for ctrl in controls:
+                mc.setAttr(ctrl + '.rotate', *rest_rotate[ctrl])
+                mc.setAttr(ctrl + '.position', rest[ctrl])
+        mc.currentTime(rest_time)
+
+    nodes = []
+    summary = {}
+    all_times = _node_times(sorted(set(n for c in CATEGORIES for n in categories[c])))
+    for category in CATEGORIES:
+        times = [(n, all_times[n]) for n in categories[category]]
+        summary[category] = {'nodes': len(times), 'seconds': sum(t for n, t in times)}
+        nodes += [{'node': n, 'type': mc.nodeType(n), 'category': category, 'seconds': t} for n, t in times]
+    nodes.sort(key=lambda n: n['seconds'], reverse=True)
+
+    report = {
+        'rig': name,
+        'root': root,
+        'scene': mc.file(q=True, sceneName=True),
+        'frames': [frames[0], frames[-1]],
+        'animate': animate,
+        'evaluation_mode': mode,
+        'timing_evaluation_mode': 'off',
+        'seconds': seconds,
+        'fps': len(frames) / seconds if seconds else 0.0,
+        'categories': summary,
+        'hot_nodes': nodes[:top],
+    }
+
+    print('VFK profile: %s, %d frames, %.1f fps (%s evaluation)' % (name, len(frames), report['fps'], mode))
+    for category in CATEGORIES:
+        print('  %-20s %5d nodes  %8.4fs' % (category, summary[category]['nodes'], summary[category]['seconds']))
+    for n in report['hot_nodes']:
+        print('  %-40s %-18s %8.4fs' % (n['node'], n['type'], n['seconds']))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        mc.profiler(output=os.path.splitext(output)[0] + '_profiler.txt')
+
+    return report